@@ -5,11 +5,13 @@ import warnings
 
 import numpy as np
 import scipy.linalg
+import scipy.sparse
 
 from .constants import GAUSSIAN_SD_FWHM
-from .operator_tools import (transition_operator, operator_extend, unit_vec,
-                             tensor, extend_vib_operator, vib_create,
-                             vib_annihilate, hilbert_subspace_index,
+from .operator_tools import (operator_extend, all_states, extend_vib_operator,
+                             vib_create, vib_annihilate, n_excitations,
+                             excitation_to_number, extract_subspace,
+                             hilbert_subspace_index,
                              basis_transform_vector, basis_transform_operator)
 from .polarization import polarization_vector, random_rotation_matrix
 from .utils import imemoize, memoized_property, check_random_state, inspect_repr
@@ -36,14 +38,18 @@ def ground_state(hamiltonian_matrix):
     rho : np.ndarray
         Density matrix for the ground state
     """
-    E, U = scipy.linalg.eigh(hamiltonian_matrix)
-    # note: U will be real valued, since H is hermitian, so there is no need to
-    # use np.conj()
-    # also note: the energies E from eigh are sorted in ascending order, so we
-    # know that E[0] is the minimum
-    rho = np.mean([np.outer(U[:, i], U[:, i]) for i in xrange(len(U))
-                   if E[i] == E[0]], axis=0)
-    return rho.astype(complex)
+    return _eig_ground_state(*scipy.linalg.eigh(hamiltonian_matrix))
+
+
+def _eig_ground_state(E, U):
+    """
+    Given the eigensystem E, U of a Hamiltonian, return its ground state, an
+    equal mixture of the (possibly degenerate) lowest energy eigenstates
+    """
+    U_ground = U[:, E == E.min()]
+    # the ground state of a real Hamiltonian is real, so don't cast it to
+    # complex (thermal_state does so where necessary)
+    return U_ground.dot(U_ground.T.conj()) / U_ground.shape[1]
 
 
 def thermal_state(hamiltonian_matrix, temperature):
@@ -68,15 +74,51 @@ def thermal_state(hamiltonian_matrix, temperature):
         rho = scipy.linalg.expm(-hamiltonian_matrix / float(temperature))
         trace = np.trace(rho)
         if trace == 0 or np.isnan(rho).any():
-            raise OverflowError(('temperature=%s too low to reliably calculate '
-                                 'thermal_state; raise it or set it to zero '
-                                 '(in which case ground_state is substituted')
-                                 % temperature)
+            raise _thermal_state_overflow(temperature)
         rho /= trace
     else:
         rho = ground_state(hamiltonian_matrix)
     return rho.astype(complex)
 
+
+def diagonal_thermal_state(energies, temperature):
+    """
+    Given the energies of a diagonal Hamiltonian and a temperature, return the
+    thermal density matrix
+
+    Equivalent to `thermal_state(np.diag(energies), temperature)`, but only
+    requires element-wise exponentials instead of a matrix exponential.
+
+    Parameters
+    ----------
+    energies : np.ndarray
+        Diagonal elements of the Hamiltonian
+    temperature : float
+        Bath temperature, in the same units as the Hamiltonian
+
+    Returns
+    -------
+    rho : np.ndarray
+        Density matrix for thermal equilibrium
+    """
+    energies = np.asarray(energies)
+    if temperature > 0:
+        weights = np.exp(-energies / float(temperature))
+        trace = weights.sum()
+        if trace == 0 or np.isnan(weights).any():
+            raise _thermal_state_overflow(temperature)
+    else:
+        weights = (energies == energies.min()).astype(float)
+        trace = weights.sum()
+    return np.diag(weights / trace).astype(complex)
+
+
+def _thermal_state_overflow(temperature):
+    return OverflowError(('temperature=%s too low to reliably calculate '
+                          'thermal_state; raise it or set it to zero '
+                          '(in which case ground_state is substituted')
+                         % temperature)
+
 def add_braket(basis_labels):
     braket_labels = []
     for label in basis_labels:
@@ -159,7 +201,8 @@ class Hamiltonian(object):
         """
         Returns the ground state of this Hamiltonian as a density operator
         """
-        return ground_state(self._not_rotating.H(subspace))
+        # reuse the (memoized) eigensystem instead of diagonalizing H again
+        return _eig_ground_state(*self._not_rotating.eig(subspace))
 
     @imemoize
     def thermal_state(self, subspace):
@@ -169,11 +212,21 @@ class Hamiltonian(object):
         If there is no bath or the bath does not define a temperature, the
         temperature is assumed to be zero.
         """
+        if self._temperature > 0:
+            return thermal_state(self._not_rotating.H(subspace),
+                                 self._temperature)
+        else:
+            return self.ground_state(subspace).astype(complex)
+
+    @property
+    def _temperature(self):
+        """
+        Temperature of the bath, or zero if it is undefined
+        """
         try:
-            temperature = self._not_rotating.bath.temperature
+            return self._not_rotating.bath.temperature
         except AttributeError:
-            temperature = 0
-        return thermal_state(self._not_rotating.H(subspace), temperature)
+            return 0
 
     @imemoize
     def in_rotating_frame(self, rw_freq=None):
@@ -228,7 +281,7 @@ class Hamiltonian(object):
         Note: The ensemble returned by this method is not stochastic. The first
         n ensemble members will always be the same.
         """
-        for n in xrange(ensemble_size):
+        for n in range(ensemble_size):
             yield self.sample(n, random_orientations)
 
     def sample(self, n=None, random_orientations=False):
@@ -318,20 +371,95 @@ class Hamiltonian(object):
         value, i.e., 0-excitation states followed by 1-excitation states
         followed by 2-excitation states.
         """
-        # solve the eigenvalue problem in the non-rotating basis to preserve
-        # the ordering between blocks for each number of excitations (eigh
-        # guarantees eigenvalues are returned in ascending order)
-        E, U = scipy.linalg.eigh(self._not_rotating.H(subspace))
-        if 'e' in subspace:
-            E[self.hilbert_subspace_index('e', subspace)] -= self.rw_freq
-        if 'f' in subspace:
-            E[self.hilbert_subspace_index('f', subspace)] -= 2 * self.rw_freq
-        return (E, U)
+        if self._not_rotating is not self:
+            # transforming to the rotating frame only shifts the energies in
+            # each excitation block, so reuse the eigenvectors of the
+            # non-rotating Hamiltonian instead of diagonalizing again
+            E, U = self._not_rotating.eig(subspace)
+            shifts = np.concatenate([
+                np.repeat(excitation_to_number(block) * self.rw_freq,
+                          self.n_states(block))
+                for block in self._eig_blocks(subspace)])
+            return (E - shifts, U)
+        # the Hamiltonian conserves the number of excitations, so solve the
+        # eigenvalue problem separately in each block (eigh guarantees
+        # eigenvalues are returned in ascending order), which is much cheaper
+        # than diagonalizing the full matrix and preserves the ordering between
+        # blocks
+        # note: np.linalg.eigh uses the divide-and-conquer LAPACK driver
+        # (?syevd) and skips scipy's check for non-finite values
+        return self._combine_block_eigs(
+            [np.linalg.eigh(self.H(block))
+             for block in self._eig_blocks(subspace)])
+
+    @staticmethod
+    def _combine_block_eigs(block_eigs):
+        """
+        Given the eigensystems of a Hamiltonian in each non-empty excitation
+        block of a subspace, returns its eigensystem in the full subspace
+        """
+        energies = np.concatenate([E for E, _ in block_eigs])
+        eigenvectors = scipy.linalg.block_diag(*[U for _, U in block_eigs])
+        return (energies, eigenvectors)
+
+    @staticmethod
+    def batch_eig(hamiltonians, subspace):
+        """
+        Solve the eigenvalue problem for many Hamiltonians at once
+
+        The Hamiltonian matrices in each excitation block are stacked and
+        diagonalized with a single call to `np.linalg.eigh`, which is much
+        faster than diagonalizing many small matrices one by one. All the
+        Hamiltonians must have the same dimensions in the given subspace.
+
+        The results are cached on the non-rotating version of each
+        Hamiltonian, so subsequent calls to `eig`, `E` or `U` on any of these
+        Hamiltonians do not diagonalize them again.
+
+        Parameters
+        ----------
+        hamiltonians : iterable of Hamiltonian
+            Hamiltonians to diagonalize, e.g., as produced by `sample_ensemble`.
+        subspace : str
+            Hilbert subspace in which to diagonalize each Hamiltonian.
+
+        Returns
+        -------
+        eigs : list
+            List of the eigensystem solutions (E, U) for each Hamiltonian, as
+            returned by the `eig` method.
+        """
+        hamiltonians = list(hamiltonians)
+        if not hamiltonians:
+            return []
+        stacked_block_eigs = [
+            np.linalg.eigh(np.array([ham._not_rotating.H(block)
+                                     for ham in hamiltonians]))
+            for block in hamiltonians[0]._eig_blocks(subspace)]
+        eigs = []
+        for n, ham in enumerate(hamiltonians):
+            block_eigs = [(E[n], U[n]) for E, U in stacked_block_eigs]
+            original = ham._not_rotating
+            imemoize.store(original, type(original).eig,
+                           original._combine_block_eigs(block_eigs),
+                           subspace)
+            eigs.append(ham.eig(subspace))
+        return eigs
+
+    def _eig_blocks(self, subspace):
+        """
+        Returns the non-empty excitation blocks of the given subspace, in order
+        of increasing number of excitations (e.g., there is no 'f' block for a
+        single site)
+        """
+        n_exc = n_excitations(self.n_sites)
+        return [block for block in extract_subspace(subspace)
+                if n_exc[excitation_to_number(block)] > 0]
 
     def E(self, subspace):
         """
         Returns the eigen-energies of the system part of this Hamiltonian in the
-        given subspace, in ascending order
+        given subspace, ordered by subspace and then by value (see `eig`)
         """
         return self.eig(subspace)[0]
 
@@ -373,14 +501,14 @@ class Hamiltonian(object):
         return basis_transform_operator(rho, U)
 
 
-    @property
+    @memoized_property
     def transition_energy(self):
         """
         A single number estimate of the excited state transition energy
         """
         return np.mean(self.E('e'))
 
-    @property
+    @memoized_property
     def freq_step(self):
         """
         An appropriate sampling rate, according to the Nyquist theorem, so that
@@ -399,7 +527,7 @@ class Hamiltonian(object):
         freq_max = max(energies.max(), -energies.min()) + freq_extra
         return 2 * freq_max
 
-    @property
+    @memoized_property
     def time_step(self):
         """
         An appropriate sampling time step, according to the Nyquist theorem, so
@@ -513,9 +641,14 @@ class ElectronicHamiltonian(Hamiltonian):
     """
     def __init__(self, H_1exc, bath=None, dipoles=None, disorder=None,
                  random_seed=0, energy_spread_extra=None, site_labels=None):
-        self.H_1exc = check_hermitian(H_1exc)
+        # store H_1exc and dipoles as contiguous floating point arrays, so
+        # they don't need to be copied or cast again by LAPACK/BLAS routines
+        H_1exc = check_hermitian(H_1exc)
+        self.H_1exc = np.ascontiguousarray(
+            H_1exc, dtype=np.result_type(H_1exc, float))
         self.bath = bath
-        self.dipoles = np.asarray(dipoles) if dipoles is not None else None
+        self.dipoles = (np.ascontiguousarray(dipoles, dtype=float)
+                        if dipoles is not None else None)
         self.disorder = disorder
         self.random_seed = random_seed
         # used by various dynamics methods to determine indices:
@@ -537,6 +670,11 @@ class ElectronicHamiltonian(Hamiltonian):
     def n_sites(self):
         return len(self.H_1exc)
 
+    def n_states(self, subspace):
+        n_exc = n_excitations(self.n_sites)
+        return sum(n_exc[excitation_to_number(block)]
+                   for block in extract_subspace(subspace))
+
     @imemoize
     def H(self, subspace):
         """
@@ -545,7 +683,8 @@ class ElectronicHamiltonian(Hamiltonian):
         return operator_extend(self.H_1exc, subspace)
 
     def _in_rotating_frame(self, rw_freq):
-        H_1exc = self.H_1exc - rw_freq * np.identity(self.n_sites)
+        H_1exc = self.H_1exc.astype(np.result_type(self.H_1exc, rw_freq))
+        H_1exc.flat[::self.n_sites + 1] -= rw_freq
         return type(self)(H_1exc, self.bath, self.dipoles, self.disorder,
                           self.random_seed, self.energy_spread_extra,
                           self.site_labels)
@@ -569,9 +708,8 @@ class ElectronicHamiltonian(Hamiltonian):
 
         H_1exc = self.H_1exc + disorder_func(random_state)
         if random_orientations:
-            dipoles = np.einsum('mn,in->im',
-                                random_rotation_matrix(random_state),
-                                self.dipoles)
+            dipoles = self.dipoles.dot(
+                random_rotation_matrix(random_state).T)
         else:
             dipoles = self.dipoles
         return type(self)(H_1exc, self.bath, dipoles, self.disorder,
@@ -586,17 +724,64 @@ class ElectronicHamiltonian(Hamiltonian):
         """
         if self.dipoles is None:
             raise HamiltonianError('transition dipole moments undefined')
-        trans_ops = [transition_operator(n, self.n_sites, subspace, transitions)
-                     for n in xrange(self.n_sites)]
-        return np.einsum('nij,nk,k->ij', trans_ops, self.dipoles,
-                         polarization_vector(polarization))
+        # polarization may be given as an array, so cache on an equivalent
+        # (hashable) tuple
+        return self._dipole_operator(
+            subspace, tuple(polarization_vector(polarization)), transitions)
+
+    @imemoize
+    def _dipole_operator(self, subspace, polarization, transitions):
+        # add the dipoles projected onto the polarization at the non-zero
+        # elements of each transition operator (which all equal one)
+        dipoles = self.dipoles.dot(polarization)
+        N = self.n_states(subspace)
+        operator = np.zeros((N, N), dtype=np.result_type(dipoles, float))
+        for n in range(self.n_sites):
+            operator[self._transition_indices(n, subspace, transitions)] += \
+                dipoles[n]
+        return operator
+
+    @imemoize
+    def _transition_indices(self, site, subspace, transitions):
+        """
+        Returns the (row, column) indices of the non-zero elements of the
+        operator for creating and/or removing an excitation at site n
+        """
+        states = all_states(self.n_sites, subspace)
+        state_indices = dict((tuple(state), i) for i, state in enumerate(states))
+        rows = []
+        cols = []
+        for j, state in enumerate(states):
+            if site not in state:
+                i = state_indices.get(tuple(sorted(state + [site])))
+                if i is not None:
+                    if '+' in transitions:
+                        rows.append(i)
+                        cols.append(j)
+                    if '-' in transitions:
+                        rows.append(j)
+                        cols.append(i)
+        return (np.array(rows, dtype=int), np.array(cols, dtype=int))
+
+    @imemoize
+    def _excited_state_indices(self, site, subspace):
+        """
+        Returns the indices of all states in the given subspace in which site n
+        is excited
+        """
+        return np.array([i for i, state
+                         in enumerate(all_states(self.n_sites, subspace))
+                         if site in state], dtype=int)
 
     def number_operator(self, site, subspace='gef'):
         """
         Returns the number operator a_n^\dagger a_n for site n
         """
-        return operator_extend(
-            np.diag(unit_vec(site, self.n_sites, dtype=float)), subspace)
+        N = self.n_states(subspace)
+        operator = np.zeros((N, N))
+        indices = self._excited_state_indices(site, subspace)
+        operator[indices, indices] = 1
+        return operator
 
     def system_bath_couplings(self, subspace='gef'):
         """
@@ -605,8 +790,27 @@ class ElectronicHamiltonian(Hamiltonian):
         """
         if self.bath is None:
             raise HamiltonianError('bath undefined')
-        return np.array([self.number_operator(n, subspace)
-                         for n in xrange(self.n_sites)])
+        N = self.n_states(subspace)
+        couplings = np.zeros((self.n_sites, N, N))
+        for n in range(self.n_sites):
+            indices = self._excited_state_indices(n, subspace)
+            couplings[n, indices, indices] = 1
+        return couplings
+
+    def system_bath_couplings_sparse(self, subspace='gef'):
+        """
+        Return a list of sparse matrix representations (in CSR format) in the
+        given subspace of the system-bath coupling operators
+        """
+        if self.bath is None:
+            raise HamiltonianError('bath undefined')
+        N = self.n_states(subspace)
+        couplings = []
+        for n in range(self.n_sites):
+            indices = self._excited_state_indices(n, subspace)
+            couplings.append(scipy.sparse.csr_matrix(
+                (np.ones(len(indices)), (indices, indices)), shape=(N, N)))
+        return couplings
 
     def basis_labels(self, subspace='gef', braket=False):
         """
@@ -691,20 +895,27 @@ class VibronicHamiltonian(Hamiltonian):
         """
         return np.prod(self.n_vibrational_levels)
 
+    def n_states(self, subspace):
+        return self.electronic.n_states(subspace) * self.n_vibrational_states
+
+    @memoized_property
+    def E_vibrational(self):
+        """
+        Returns the energies of the vibrational states included explicitly in
+        this model (the diagonal of `H_vibrational`)
+        """
+        # np.indices gives the occupation number of each mode for every state,
+        # in the same order as the tensor products in extend_vib_operator
+        occupations = np.indices(self.n_vibrational_levels)
+        return np.tensordot(self.vib_energies, occupations, axes=1).reshape(-1)
+
     @memoized_property
     def H_vibrational(self):
         """
         Returns the Hamiltonian of the vibrations included explicitly in this
         model
         """
-        H_vib = np.diag(np.zeros(self.n_vibrational_states))
-        for m, (num_levels, vib_energy) in \
-                enumerate(zip(self.n_vibrational_levels, self.vib_energies)):
-            vib_operator = np.diag(np.arange(num_levels))
-            H_vib += (vib_energy
-                      * extend_vib_operator(self.n_vibrational_levels, m,
-                                            vib_operator))
-        return H_vib
+        return np.diag(self.E_vibrational)
 
     def H_electronic_vibrational(self, subspace='gef'):
         """
@@ -715,19 +926,26 @@ class VibronicHamiltonian(Hamiltonian):
         singly excited subspace, and b(m) and b(m)^\dagger are the
         annihilation and creation operators for vibrational mode m
         """
-        H_el_vib = np.diag(np.zeros(self.electronic.n_states(subspace)
-                                    * self.n_vibrational_states))
-        for i in np.arange(self.electronic.n_sites):
-            el_operator = self.electronic.number_operator(i, subspace)
-            for m, num_levels in enumerate(self.n_vibrational_levels):
-                vib_operator = (vib_annihilate(num_levels)
+        # the coupling is diagonal in the electronic states, so H_el_vib is
+        # block diagonal, with a block for each electronic state given by the
+        # sum over its excited sites n of sum_m c_{nm}*(b(m) + b(m)^\dagger)
+        states = all_states(self.n_sites, subspace)
+        el_couplings = np.array([self.elec_vib_couplings[state].sum(axis=0)
+                                 for state in states])
+        vib_operators = np.array([
+            extend_vib_operator(self.n_vibrational_levels, m,
+                                vib_annihilate(num_levels)
                                 + vib_create(num_levels))
-                H_el_vib += (self.elec_vib_couplings[i, m]
-                             * tensor(el_operator,
-                                      extend_vib_operator(
-                                          self.n_vibrational_levels,
-                                          m, vib_operator)))
-        return H_el_vib
+            for m, num_levels in enumerate(self.n_vibrational_levels)])
+        blocks = np.tensordot(el_couplings, vib_operators, axes=1)
+
+        n_el = len(el_couplings)
+        n_vib = int(self.n_vibrational_states)
+        dtype = np.result_type(self.elec_vib_couplings, float)
+        H_el_vib = np.zeros((n_el, n_vib, n_el, n_vib), dtype=dtype)
+        el_states = np.arange(n_el)
+        H_el_vib[el_states, :, el_states] = blocks
+        return H_el_vib.reshape(n_el * n_vib, n_el * n_vib)
 
     @imemoize
     def H(self, subspace='gef'):
@@ -735,9 +953,30 @@ class VibronicHamiltonian(Hamiltonian):
         Returns the matrix representation of the system Hamiltonian in the
         given electronic subspace
         """
-        return (self.el_to_sys_operator(self.electronic.H(subspace))
-                + self.vib_to_sys_operator(self.H_vibrational, subspace)
-                + self.H_electronic_vibrational(subspace))
+        H_el = self.el_to_sys_operator(self.electronic.H(subspace))
+        H_el_vib = self.H_electronic_vibrational(subspace)
+        # choose the dtype of the sum upfront, and accumulate in place
+        H = np.zeros(H_el.shape, dtype=np.result_type(H_el, self.H_vibrational,
+                                                      H_el_vib))
+        H += H_el
+        H += self.vib_to_sys_operator(self.H_vibrational, subspace)
+        H += H_el_vib
+        return H
+
+    @imemoize
+    def thermal_state(self, subspace):
+        """
+        Returns the thermal state of this Hamiltonian as a density operator
+
+        If there is no bath or the bath does not define a temperature, the
+        temperature is assumed to be zero.
+        """
+        if 'e' not in subspace and 'f' not in subspace:
+            # in the electronic ground state, the Hamiltonian is H_vibrational,
+            # which is diagonal
+            return diagonal_thermal_state(self._not_rotating.E_vibrational,
+                                          self._temperature)
+        return super(VibronicHamiltonian, self).thermal_state(subspace)
 
     def _in_rotating_frame(self, rw_freq):
         return type(self)(self.electronic.in_rotating_frame(rw_freq),
@@ -756,7 +995,17 @@ class VibronicHamiltonian(Hamiltonian):
         Extends the electronic operator el_operator, which may be in an
         electronic subspace, into a system operator in that subspace
         """
-        return tensor(el_operator, np.eye(self.n_vibrational_states))
+        # equivalent to tensor(el_operator, np.eye(n_vib)) (broadcasting over
+        # any leading dimensions), but only writes the non-zero elements
+        el_operator = np.asarray(el_operator)
+        n_el = el_operator.shape[-1]
+        n_vib = int(self.n_vibrational_states)
+        extra_dims = el_operator.shape[:-2]
+        sys_operator = np.zeros(extra_dims + (n_el, n_vib, n_el, n_vib),
+                                dtype=np.result_type(el_operator, float))
+        vib_states = np.arange(n_vib)
+        sys_operator[..., vib_states, :, vib_states] = el_operator
+        return sys_operator.reshape(extra_dims + (n_el * n_vib, n_el * n_vib))
 
     def vib_to_sys_operator(self, vib_operator, subspace='gef'):
         """
@@ -764,7 +1013,16 @@ class VibronicHamiltonian(Hamiltonian):
         vibrational subspace, into a system operator in that subspace
         and in the given electronic subspace
         """
-        return tensor(np.eye(self.electronic.n_states(subspace)), vib_operator)
+        # equivalent to tensor(np.eye(n_el), vib_operator), but only writes the
+        # non-zero elements
+        vib_operator = np.asarray(vib_operator)
+        n_el = self.electronic.n_states(subspace)
+        n_vib = len(vib_operator)
+        sys_operator = np.zeros((n_el, n_vib, n_el, n_vib),
+                                dtype=np.result_type(vib_operator, float))
+        el_states = np.arange(n_el)
+        sys_operator[el_states, :, el_states] = vib_operator
+        return sys_operator.reshape(n_el * n_vib, n_el * n_vib)
 
     def dipole_operator(self, *args, **kwargs):
         """
@@ -782,8 +1040,19 @@ class VibronicHamiltonian(Hamiltonian):
         return self.el_to_sys_operator(
             self.electronic.system_bath_couplings(*args, **kwargs))
 
+    def system_bath_couplings_sparse(self, *args, **kwargs):
+        """
+        Return a list of sparse matrix representations (in CSR format) in the
+        given subspace of the system-bath coupling operators
+        """
+        vib_identity = scipy.sparse.identity(self.n_vibrational_states)
+        return [scipy.sparse.kron(coupling, vib_identity, format='csr')
+                for coupling in self.electronic.system_bath_couplings_sparse(
+                    *args, **kwargs)]
+
     def vib_basis_labels(self):
-        vib_label_operator = np.diag(np.zeros(self.n_vibrational_states))
+        vib_label_operator = np.zeros((self.n_vibrational_states,
+                                       self.n_vibrational_states))
         num_sites = len(self.n_vibrational_levels)
         for m, num_levels in enumerate(self.n_vibrational_levels):
             index = 10 ** (num_sites - m - 1)
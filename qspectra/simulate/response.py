@@ -333,7 +333,9 @@ def _third_order_response(dynamical_model, coherence_time_max,
         else:
             V_Gt3 = integrate(eom_heisen, V[3].bra_vector, t3,
                               **integrate_kwargs)
-            total_signal += np.einsum('ci,abi', V_Gt3, V_rho2)
+            # equivalent to np.einsum('ci,abi', V_Gt3, V_rho2), but
+            # tensordot uses BLAS
+            total_signal += np.tensordot(V_rho2, V_Gt3, axes=(-1, -1))
     return (t1, t2, t3), total_signal
 
 
@@ -70,18 +70,37 @@ class imemoize(object):
         return functools.partial(self, obj)
 
     def __call__(self, *args, **kw):
-        obj = args[0]
-        try:
-            cache = obj.__cache
-        except AttributeError:
-            cache = obj.__cache = {}
-        key = (self.func, args[1:], frozenset(kw.items()))
+        cache = self._cache(args[0])
+        key = self._key(self.func, args[1:], kw)
         try:
             res = cache[key]
         except KeyError:
             res = cache[key] = self.func(*args, **kw)
         return res
 
+    @classmethod
+    def store(cls, obj, func, value, *args, **kw):
+        """
+        Store a precomputed return value in the cache of the given instance
+
+        After calling this method, `obj.method(*args, **kw)` returns `value`,
+        where `func` is the undecorated method (as found by looking up the
+        imemoize decorated method on the class of `obj`).
+        """
+        cls._cache(obj)[cls._key(func, args, kw)] = value
+
+    @staticmethod
+    def _cache(obj):
+        try:
+            return obj.__cache
+        except AttributeError:
+            cache = obj.__cache = {}
+            return cache
+
+    @staticmethod
+    def _key(func, args, kw):
+        return (func, args, frozenset(kw.items()))
+
 
 def check_random_state(seed):
     """Cast seed into a np.random.RandomState object
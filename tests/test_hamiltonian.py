@@ -4,7 +4,7 @@ import warnings
 import numpy as np
 from numpy.testing import assert_allclose
 
-from qspectra import hamiltonian, GAUSSIAN_SD_FWHM
+from qspectra import hamiltonian, operator_tools, GAUSSIAN_SD_FWHM
 
 
 class TestCheckHermitian(unittest.TestCase):
@@ -16,6 +16,17 @@ class TestCheckHermitian(unittest.TestCase):
             hamiltonian.check_hermitian([[1, 1], [-1, -1]])
 
 
+class TestDiagonalThermalState(unittest.TestCase):
+    def test(self):
+        energies = np.array([0, 1, 1, 3.5])
+        for temperature in [0, 0.5, 2]:
+            assert_allclose(
+                hamiltonian.diagonal_thermal_state(energies, temperature),
+                hamiltonian.thermal_state(np.diag(energies), temperature))
+        with self.assertRaises(OverflowError):
+            hamiltonian.diagonal_thermal_state([1, 2], 1e-25)
+
+
 class SharedTests(object):
     def test_rotating_frame(self):
         self.assertEqual(self.H_sys, self.H_sys.in_rotating_frame(0))
@@ -57,6 +68,20 @@ class SharedTests(object):
         self.assertEqual(list(self.H_sys.sample_ensemble(3)),
                          [self.H_sys.sample(n) for n in range(3)])
 
+    def test_batch_eig(self):
+        hams = list(self.H_sys.in_rotating_frame(1).sample_ensemble(3))
+        eigs = hamiltonian.Hamiltonian.batch_eig(hams, 'gef')
+        for ham, (E, U) in zip(hams, eigs):
+            self.assertIs(ham.E('gef'), E)
+            self.assertIs(ham.U('gef'), U)
+        for n, (E, U) in enumerate(eigs):
+            expected = self.H_sys.in_rotating_frame(1).sample(n)
+            assert_allclose(E, expected.E('gef'))
+            assert_allclose(abs(U), abs(expected.U('gef')), atol=1e-10)
+            assert_allclose(hams[n]._not_rotating.E('gef'),
+                            self.H_sys.sample(n).E('gef'))
+        self.assertEqual(hamiltonian.Hamiltonian.batch_eig([], 'gef'), [])
+
     def test_state_consistency(self):
         for state in (self.H_sys.ground_state('gef'),
                       self.H_sys.thermal_state('gef')):
@@ -99,6 +124,10 @@ class TestElectronicHamiltonian(unittest.TestCase, SharedTests):
         assert_allclose(self.H_sys.dipole_operator('gef', 'x', '-+'),
                         [[0, 1, 0, 0], [1, 0, 0, 0],
                          [0, 0, 0, 1], [0, 0, 1, 0]])
+        for transitions in ['+', '-', '-+']:
+            assert_allclose(
+                self.H_sys.dipole_operator('gef', 'y', transitions),
+                operator_tools.transition_operator(1, 2, 'gef', transitions))
         H_no_dipoles = hamiltonian.ElectronicHamiltonian(self.M)
         with self.assertRaises(hamiltonian.HamiltonianError):
             H_no_dipoles.dipole_operator()
@@ -150,6 +179,11 @@ class TestElectronicHamiltonian(unittest.TestCase, SharedTests):
                         [[1, 0, 0], [0, 0, 0], [0, 0, 0]])
         H_degenerate = construct_elec([[1, 0], [0, 1]])
         assert_allclose(H_degenerate.ground_state('e'), [[0.5, 0], [0, 0.5]])
+        M_complex = np.array([[1, 0.3j], [-0.3j, 2]])
+        for state in (construct_elec(M_complex).ground_state('e'),
+                      hamiltonian.ground_state(M_complex)):
+            hamiltonian.check_hermitian(state)
+            self.assertAlmostEqual(np.trace(state), 1)
 
     def test_thermal_state(self):
         assert_allclose(self.H_sys.thermal_state('e'), [[1, 0], [0, 0]])
@@ -208,10 +242,54 @@ class TestVibronicHamiltonian(unittest.TestCase, SharedTests):
         assert_allclose(self.H_sys.thermal_state('g'),
                         1 / (1 + np.exp(-5)) * np.diag([1, np.exp(-5)]))
 
+    def test_two_modes(self):
+        H_E = hamiltonian.ElectronicHamiltonian([[1.0, 0.5], [0.5, 2.0]])
+        levels = [3, 2]
+        vib_energies = [10, 7]
+        couplings = np.array([[1.0, 2.0], [3.0, 4.0]])
+        H_sys = hamiltonian.VibronicHamiltonian(H_E, levels, vib_energies,
+                                                couplings)
+
+        def vib_op(m, op):
+            ops = [np.eye(n) for n in levels]
+            ops[m] = op
+            return np.kron(*ops)
+
+        b = [np.diag(np.sqrt(np.arange(1, n)), k=1) for n in levels]
+        H_vib = sum(energy * vib_op(m, b[m].T.dot(b[m]))
+                    for m, energy in enumerate(vib_energies))
+        assert_allclose(H_sys.H_vibrational, H_vib)
+        # number operators of each site in the 'gef' subspace
+        N = [np.diag([0, 1, 0, 1]), np.diag([0, 0, 1, 1])]
+        H_el_vib = sum(couplings[n, m] * np.kron(N[n], vib_op(m, b[m] + b[m].T))
+                       for n in range(2) for m in range(2))
+        assert_allclose(H_sys.H('gef'), np.kron(H_E.H('gef'), np.eye(6))
+                        + np.kron(np.eye(4), H_vib) + H_el_vib)
+
+    def test_eig(self):
+        # single site, so the 'f' block is empty
+        E_e = 6 + np.sqrt(50) * np.array([-1, 1])
+        assert_allclose(self.H_sys.E('gef'), np.r_[0, 10, E_e])
+        # the g and e energies overlap, but eigenstates are still ordered by
+        # block first and then by value
+        assert_allclose(self.H_sys.E('ge'), np.r_[0, 10, E_e])
+        U = self.H_sys.U('ge')
+        assert_allclose(U[:2, 2:], 0)
+        assert_allclose(U[2:, :2], 0)
+        assert_allclose(self.H_sys.in_rotating_frame(2).E('ge'),
+                        np.r_[0, 10, E_e - 2])
+
     def test_operators(self):
+        X = np.array([[1, 2j], [-2j, 3]])
+        assert_allclose(self.H_sys.el_to_sys_operator(X), np.kron(X, np.eye(2)))
+        assert_allclose(self.H_sys.vib_to_sys_operator(X, 'ge'),
+                        np.kron(np.eye(2), X))
         assert_allclose(self.H_sys.system_bath_couplings('ge'),
                         [[[0, 0, 0, 0], [0, 0, 0, 0],
                           [0, 0, 1, 0], [0, 0, 0, 1]]])
+        assert_allclose([coupling.toarray() for coupling
+                         in self.H_sys.system_bath_couplings_sparse('gef')],
+                        self.H_sys.system_bath_couplings('gef'))
 
     def test_basis_labels(self):
         self.assertEqual(self.H_sys.basis_labels('gef', braket=1),
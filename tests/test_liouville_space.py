@@ -46,10 +46,10 @@ class TestSuperOperators(unittest.TestCase):
     def test_tensor_to_super(self):
         R_tensor = np.random.rand(2, 2, 2, 2)
         R_super = liouville_space.tensor_to_super(R_tensor)
-        for i in xrange(2):
-            for j in xrange(2):
-                for k in xrange(2):
-                    for l in xrange(2):
+        for i in range(2):
+            for j in range(2):
+                for k in range(2):
+                    for l in range(2):
                         self.assertEquals(R_tensor[i, j, k, l],
                                           R_super[i + 2 * j, k + 2 * l])
 